@@ -2,20 +2,33 @@
 # api/app.py
 
 import os
-import json
 import logging
 import re
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl
 from dotenv import load_dotenv
 load_dotenv()
 import openai
-import uvicorn
 
 # ─── Bring in your RAG retriever ──────────────────────────────────────────────
 from query_rag import retrieve  # returns List[dict] with keys ticker, accession, chunk_index, filing_date, score, text, form, cik, url
+# Configured origins and Vercel preview patterns are resolved once at import
+CONFIGURED_ORIGINS = [
+    o.strip().rstrip('/')
+    for o in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+    if o.strip()
+]
+# Any deployment URL of an allowed Vercel app: configured origin like
+# "https://a-inalyst.vercel.app" allows https://a-inalyst-*.vercel.app
+VERCEL_PATTERNS = [
+    re.compile(rf"https://{o.split('.')[0].split('//')[-1]}.*\.vercel\.app")
+    for o in CONFIGURED_ORIGINS
+    if "vercel.app" in o
+]
+
 # Custom CORS origin checker that handles Vercel deployment URLs
 def is_origin_allowed(origin: str) -> bool:
     if not origin:
@@ -25,27 +38,13 @@ def is_origin_allowed(origin: str) -> bool:
     if origin.startswith("http://localhost") or origin.startswith("http://127.0.0.1"):
         return True
     
-    # Get configured origins
-    configured_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
-    configured_origins = [o.strip().rstrip('/') for o in configured_origins if o.strip()]
-    
     # Check exact matches (with and without trailing slash)
     origin_clean = origin.rstrip('/')
-    for configured in configured_origins:
-        if origin_clean == configured or origin_clean == configured + '/':
-            return True
-    
-    # Check Vercel patterns: allow any deployment URL for allowed Vercel apps
-    for configured in configured_origins:
-        if "vercel.app" in configured:
-            # Extract app name from configured origin like "https://a-inalyst.vercel.app"
-            app_name = configured.split('.')[0].split('//')[-1]
-            # Check if origin matches pattern: https://a-inalyst-*.vercel.app
-            vercel_pattern = f"https://{app_name}.*\.vercel\.app"
-            if re.match(vercel_pattern, origin):
-                return True
+    if origin_clean in CONFIGURED_ORIGINS:
+        return True
     
-    return False
+    # Check Vercel patterns
+    return any(p.match(origin) for p in VERCEL_PATTERNS)
 
 # Use wildcard for CORS middleware but implement custom checking
 all_origins = ["*"]
@@ -59,7 +58,7 @@ app = FastAPI(
 # Log CORS configuration for debugging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-logger.info(f"CORS allowed origins: {all_origins}")
+logger.info("CORS allowed origins: %s", all_origins)
 app.add_middleware(
   CORSMiddleware,
   allow_origins=all_origins,  # Allow both with and without trailing slashes
@@ -71,24 +70,24 @@ app.add_middleware(
 # Add request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    origin = request.headers.get("origin", "No origin")
-    origin_allowed = is_origin_allowed(origin) if origin != "No origin" else False
-    logger.info(f"Request: {request.method} {request.url.path} from origin: {origin}")
-    logger.info(f"Origin allowed: {origin_allowed}")
+    origin = request.headers.get("origin")
     
-    # Block requests from disallowed origins
-    if request.method == "OPTIONS" and origin != "No origin" and not origin_allowed:
-        logger.warning(f"Blocked CORS request from disallowed origin: {origin}")
+    # Block preflights from disallowed origins (other methods are not gated,
+    # so the origin check only runs when it can change the outcome)
+    if request.method == "OPTIONS" and origin is not None and not is_origin_allowed(origin):
+        logger.warning("Blocked CORS request from disallowed origin: %s", origin)
         return Response(status_code=403, content="CORS: Origin not allowed")
     
     response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
+    # One lazily formatted record per request
+    logger.info("%s %s from origin: %s -> %s",
+                request.method, request.url.path, origin or "No origin", response.status_code)
     return response
 # ─── Request/response schemas ─────────────────────────────────────────────────
 class AskRequest(BaseModel):
     query: str
     k: int = 5
-    api_key: str
+    api_key: str = Field(min_length=1)  # blank would fall back to the server key
     chat_model: str
 
 class ContextItem(BaseModel):
@@ -107,6 +106,12 @@ class AskResponse(BaseModel):
     context: list[ContextItem]
 
 # ─── Explicit OPTIONS handler for /ask endpoint ─────────────────────────────
+# Static part of the preflight response; only the echoed origin varies
+PREFLIGHT_HEADERS = {
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, Origin, Accept",
+}
+
 @app.options("/ask")
 async def ask_options(request: Request):
     origin = request.headers.get("origin", "")
@@ -114,22 +119,26 @@ async def ask_options(request: Request):
     if is_origin_allowed(origin):
         return Response(
             status_code=200,
-            headers={
-                "Access-Control-Allow-Origin": origin,
-                "Access-Control-Allow-Methods": "POST, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type, Authorization, Origin, Accept",
-            }
+            headers={"Access-Control-Allow-Origin": origin, **PREFLIGHT_HEADERS}
         )
     else:
-        logger.warning(f"OPTIONS request denied for origin: {origin}")
+        logger.warning("OPTIONS request denied for origin: %s", origin)
         return Response(status_code=403, content="CORS: Origin not allowed")
 
 # ─── The /ask endpoint ───────────────────────────────────────────────────────
+# Shared clients (and connection pools) for every request; the caller's key
+# is applied per call via with_options and not kept afterwards, so both the
+# query embedding and the chat completion are billed to the caller
+EMBED_CLIENT = openai.OpenAI()
+CHAT_CLIENT = openai.AsyncOpenAI()
+
 @app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
-    openai.api_key = req.api_key
-    # 1) Retrieve top-k chunks
-    hits = retrieve(req.query, k=req.k)
+async def ask(req: AskRequest):
+    # 1) Retrieve top-k chunks (blocking embed + FAISS search, off the event loop)
+    hits = await run_in_threadpool(
+        retrieve, req.query, k=req.k,
+        client=EMBED_CLIENT.with_options(api_key=req.api_key)
+    )
     if not hits:
         raise HTTPException(status_code=404, detail="No relevant chunks found.")
 
@@ -140,20 +149,19 @@ def ask(req: AskRequest):
         {"role": "user",   "content": f"Context:\n{context_blob}\n\nQuestion: {req.query}"}
     ]
 
-    # 3) Call the OpenAI Chat Completion (v1 library)
-    chat_resp = openai.chat.completions.create(
+    # 3) Call the OpenAI Chat Completion (v1 library) with the caller's key,
+    #    awaited so other requests keep running meanwhile
+    chat_resp = await CHAT_CLIENT.with_options(api_key=req.api_key).chat.completions.create(
         model=req.chat_model,
         messages=messages
     )
     answer = chat_resp.choices[0].message.content
 
-    # 4) Return the answer + context
-    return AskResponse(
-        answer=answer,
-        context=[ContextItem(**h) for h in hits]
-    )
+    # 4) Return the answer + context; response_model validates the hit dicts
+    #    once on the way out, no intermediate ContextItem list needed
+    return {"answer": answer, "context": hits}
 
 # ─── Run with Uvicorn ───────────────────────────────────────────────────────
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+    import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -34,8 +34,10 @@ Produces:
     data/<TICKER>/<TICKER>_CF.json      # for Company Facts
 """
 
-import os, json, time, logging, requests, re, html
+import os, json, time, logging, requests, re, html, threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
+from typing import Optional
 from dateutil.parser import parse as parse_date
 
 # ─── CONFIGURATION ──────────────────────────────────────────────────────────────
@@ -45,12 +47,25 @@ MODE = os.getenv("MODE", "DEMO")
 # Your contact information for SEC User-Agent
 USER_AGENT = os.getenv("USER_AGENT")
 
+# Parallel filing downloads per company (still capped by SEC_MAX_RPS)
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+
 # ─── Constants ──────────────────────────────────────────────────────────────────
 OUTPUT_DIR = "data"
 MAPPING_FILE = "company_tickers.json"
 WANTED_FORMS = ["10-K", "10-Q", "CF"]
+# Full-text forms matched against every entry of a submissions history
+PERIODIC_FORMS = frozenset({"10-K", "10-Q"})
 MAPPING_URL = "https://www.sec.gov/files/company_tickers.json"
 
+# Shared HTTP session: keeps connections to sec.gov / data.sec.gov alive
+# across the hundreds of requests a run makes instead of a new TLS
+# handshake per request
+SESSION = requests.Session()
+
+# SEC fair-access policy allows 10 requests/second per client
+SEC_MAX_RPS = 10
+
 # Demo mode companies (top 5 S&P 500 by market cap)
 DEMO_COMPANIES = ["AAPL"]
 
@@ -60,19 +75,78 @@ try:
 except ImportError:
     BeautifulSoup = None
 
+# optional C-based tree builder for BeautifulSoup (much faster on large filings)
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+# ─── Rate limiting ──────────────────────────────────────────────────────────────
+class RateLimiter:
+    """
+    Token bucket: allows bursts up to `capacity` requests and refills at
+    `rate` tokens per second. acquire() only sleeps when the bucket is empty,
+    so fast responses are not penalised by a fixed per-request delay.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            # Reserve a token even if it puts the bucket in debt; the caller
+            # then waits out exactly its own share of the deficit
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+# capacity=1 means no burst allowance: requests from all threads share one
+# schedule spaced 1/SEC_MAX_RPS apart, a steady SEC_MAX_RPS. A larger
+# capacity would let a full bucket fire on top of the refill rate.
+SEC_LIMITER = RateLimiter(rate=SEC_MAX_RPS, capacity=1)
+
+
+def sec_get(url: str, user_agent: str) -> requests.Response:
+    """Rate-limited GET against SEC endpoints; raises on HTTP errors."""
+    SEC_LIMITER.acquire()
+    r = SESSION.get(url, headers={"User-Agent": user_agent})
+    r.raise_for_status()
+    return r
+
 
 # ─── Get S&P 500 companies ──────────────────────────────────────────────────────
+def _is_ticker(t: str) -> bool:
+    """Plain string check for "ABC" / "BRK.B" shaped tickers (no regex engine)."""
+    if not t or len(t) > 5 or not t.isascii():
+        return False
+    head, dot, tail = t.partition(".")
+    if dot and not (len(tail) == 1 and tail.isalpha() and tail.isupper()):
+        return False
+    return head.isalpha() and head.isupper()
+
+
 def get_sp500_tickers() -> list[str]:
     """Fetch current S&P 500 companies from Wikipedia"""
     try:
         url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
         headers = {"User-Agent": USER_AGENT}
-        r = requests.get(url, headers=headers)
+        r = SESSION.get(url, headers=headers)
         r.raise_for_status()
         
         # Try BeautifulSoup first for better parsing
         if BeautifulSoup:
-            soup = BeautifulSoup(r.text, 'html.parser')
+            soup = BeautifulSoup(r.text, HTML_PARSER)
             
             # Find the main S&P 500 table
             table = soup.find('table', {'id': 'constituents'})
@@ -105,16 +179,15 @@ def get_sp500_tickers() -> list[str]:
                 if matches:
                     tickers.extend(matches)
                     
-            tickers = list(set(tickers))
-            tickers = [t for t in tickers if len(t) <= 5 and re.match(r'^[A-Z]+(\.[A-Z])?$', t)]
+            tickers = [t for t in tickers if _is_ticker(t)]
         
-        # Remove duplicates
-        tickers = list(set(tickers))
+        # Remove duplicates (order-preserving, so the 500 cap is deterministic)
+        tickers = list(dict.fromkeys(tickers))
         
         logging.info(f"Found {len(tickers)} S&P 500 tickers")
         return tickers[:500]  # Limit to 500 to be safe
     except Exception as e:
-        logging.error(f"Failed to fetch S&P 500 list: {e}")
+        logging.error("Failed to fetch S&P 500 list: %s", e)
         # Fallback to a hardcoded list of major S&P 500 companies
         return [
             "AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "BRK.B", "TSLA", 
@@ -130,8 +203,7 @@ def get_sp500_tickers() -> list[str]:
 def load_ticker_cik_mapping(mapping_file: str, user_agent: str) -> dict[str,str]:
     if not os.path.exists(mapping_file):
         logging.info(f"Downloading ticker→CIK mapping from {MAPPING_URL}")
-        r = requests.get(MAPPING_URL, headers={"User-Agent": user_agent})
-        r.raise_for_status()
+        r = sec_get(MAPPING_URL, user_agent)
         with open(mapping_file, "w") as f:
             f.write(r.text)
     data = json.load(open(mapping_file, encoding="utf-8"))
@@ -140,15 +212,16 @@ def load_ticker_cik_mapping(mapping_file: str, user_agent: str) -> dict[str,str]
 
 
 # ─── Fetch ALL company submissions including archived ones ──────────────────────
-def fetch_all_company_filings(pad_cik: str, user_agent: str) -> tuple[list, list, list]:
+def fetch_all_company_filings(pad_cik: str, user_agent: str,
+                               start_date: Optional[date] = None) -> tuple[list, list, list]:
     """
     Fetch all company filings, including those in additional archive files.
+    Archive files whose newest filing predates start_date are not fetched.
     Returns combined lists of (forms, dates, accessions)
     """
     url = f"https://data.sec.gov/submissions/CIK{pad_cik}.json"
     logging.info(f"Fetching submissions for CIK {pad_cik}")
-    r = requests.get(url, headers={"User-Agent": user_agent})
-    r.raise_for_status()
+    r = sec_get(url, user_agent)
     subs = r.json()
     
     # Start with recent filings
@@ -159,47 +232,63 @@ def fetch_all_company_filings(pad_cik: str, user_agent: str) -> tuple[list, list
     
     # Check for additional filing files (common for banks and large filers)
     files = subs.get("filings", {}).get("files", [])
-    if files:
-        logging.info(f"  Found {len(files)} additional filing files for CIK {pad_cik}")
-        for file_ref in files:
-            file_name = file_ref.get("name", "")
-            if file_name:
-                file_url = f"https://data.sec.gov/submissions/{file_name}"
-                logging.info(f"  Fetching additional filings from {file_name}")
-                try:
-                    r = requests.get(file_url, headers={"User-Agent": user_agent})
-                    r.raise_for_status()
-                    additional_data = r.json()
-                    
-                    # Append the additional filings
-                    all_forms.extend(additional_data.get("form", []))
-                    all_dates.extend(additional_data.get("filingDate", []))
-                    all_accessions.extend(additional_data.get("accessionNumber", []))
-                    
-                    time.sleep(0.1)  # Rate limiting
-                except Exception as e:
-                    logging.error(f"  Failed to fetch additional filings from {file_name}: {e}")
+    # Each archive entry carries its filingFrom/filingTo range (ISO dates, so
+    # string comparison is date order); pages that end before start_date
+    # cannot contain anything we keep, so don't download them at all
+    start_iso = start_date.isoformat() if start_date else ""
+    file_names = [
+        f["name"] for f in files
+        if f.get("name") and (f.get("filingTo") or start_iso) >= start_iso
+    ]
+    if file_names:
+        logging.info(f"  Found {len(file_names)} additional filing files for CIK {pad_cik}")
+        # Archive pages are independent: fetch them concurrently (SEC_LIMITER
+        # still paces the requests); map() keeps their original order
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            pages = list(pool.map(lambda name: fetch_submissions_page(name, user_agent), file_names))
+        for additional_data in pages:
+            if additional_data is None:
+                continue
+            # Append the additional filings
+            all_forms.extend(additional_data.get("form", []))
+            all_dates.extend(additional_data.get("filingDate", []))
+            all_accessions.extend(additional_data.get("accessionNumber", []))
     
     return all_forms, all_dates, all_accessions
 
 
+def fetch_submissions_page(file_name: str, user_agent: str) -> Optional[dict]:
+    """Fetch one archived submissions page; returns None (logged) on failure."""
+    file_url = f"https://data.sec.gov/submissions/{file_name}"
+    logging.info(f"  Fetching additional filings from {file_name}")
+    try:
+        return sec_get(file_url, user_agent).json()
+    except Exception as e:
+        logging.error("  Failed to fetch additional filings from %s: %s", file_name, e)
+        return None
+
+
 # ─── Check if form matches our criteria ─────────────────────────────────────────
-def is_matching_form(form: str, wanted_forms: list[str]) -> bool:
+def is_matching_form(form: str, wanted_forms: frozenset[str]) -> bool:
     """
     Check if a form type matches our wanted forms, including amended versions.
     E.g., both "10-K" and "10-K/A" match if "10-K" is wanted.
     """
-    form_upper = form.upper()
-    for wanted in wanted_forms:
-        if wanted == "CF":
-            continue
-        # Match exact form or amended version (with /A suffix)
-        if form_upper == wanted or form_upper.startswith(f"{wanted}/"):
-            return True
-    return False
+    # Exact form and amended versions share the part before the first "/",
+    # so one split + membership test replaces the per-wanted-form scan
+    base_form = form.upper().split("/", 1)[0]
+    return base_form != "CF" and base_form in wanted_forms
 
 
 # ─── Clean & extract 10-K/10-Q text ─────────────────────────────────────────────
+# Patterns are compiled once here; they run over every multi-MB submission
+CHECKBOX_RE   = re.compile(r"[\u2610\u2611\u2612]")
+WHITESPACE_RE = re.compile(r"\s+")
+DOC_TYPE_RE   = re.compile(r"<TYPE>\s*([^\s<]+)", re.IGNORECASE)
+IX_TAG_RE     = re.compile(r"</?ix:[^>]+?>", re.IGNORECASE)
+HTML_TAG_RE   = re.compile(r"<[^>]+>")
+ITEM1_RE      = re.compile(r"\bITEM\s+1[A-Z]?\.", re.IGNORECASE)
+
 def clean_filing_text(text: str) -> str:
     # decode unicode escapes
     text = text.encode("utf-8").decode("unicode_escape", errors="ignore")
@@ -209,24 +298,38 @@ def clean_filing_text(text: str) -> str:
     except Exception:
         pass
     # strip checkboxes
-    text = re.sub(r"[\u2610\u2611\u2612]", "", text)
+    text = CHECKBOX_RE.sub("", text)
     # collapse whitespace
-    text = re.sub(r"\s+", " ", text).strip()
+    text = WHITESPACE_RE.sub(" ", text).strip()
     return html.unescape(text)
 
 
+def _document_spans(raw: str):
+    """
+    Lazily yield (start, end) offsets of each <DOCUMENT> section. Unlike
+    raw.split(), exhibits and encoded graphics we skip are never copied.
+    """
+    start = raw.find("<DOCUMENT>")
+    while start != -1:
+        start += len("<DOCUMENT>")
+        end = raw.find("<DOCUMENT>", start)
+        yield start, (end if end != -1 else len(raw))
+        start = end
+
+
 def extract_filing_text(raw: str, form_type: str) -> str:
     # Normalize form type for extraction (remove /A suffix)
     base_form = form_type.split("/")[0]
     
     fragments = []
+    # lower-cased once here rather than per document per marker
     markers = [
-        f"FORM {base_form}",
-        "UNITED STATES SECURITIES AND EXCHANGE COMMISSION",
-        "ANNUAL REPORT", "QUARTERLY REPORT"
+        f"form {base_form.lower()}",
+        "united states securities and exchange commission",
+        "annual report", "quarterly report"
     ]
-    for doc in raw.split("<DOCUMENT>")[1:]:
-        m = re.search(r"<TYPE>\s*([^\s<]+)", doc, flags=re.IGNORECASE)
+    for start, end in _document_spans(raw):
+        m = DOC_TYPE_RE.search(raw, start, end)
         if not m:
             continue
         doc_type = m.group(1).upper()
@@ -234,26 +337,26 @@ def extract_filing_text(raw: str, form_type: str) -> str:
         if not (doc_type == form_type or doc_type == base_form):
             continue
             
+        doc = raw[start:end]
         body = doc.split("<TEXT>", 1)[1] if "<TEXT>" in doc else doc
         # strip inline XBRL
-        body = re.sub(r"<ix:[^>]+?>", "", body, flags=re.IGNORECASE)
-        body = re.sub(r"</ix:[^>]+?>", "", body, flags=re.IGNORECASE)
+        body = IX_TAG_RE.sub("", body)
         # strip HTML/XML
         if BeautifulSoup:
-            text = BeautifulSoup(body, "html.parser").get_text(separator=" ")
+            text = BeautifulSoup(body, HTML_PARSER).get_text(separator=" ")
         else:
-            text = re.sub(r"<[^>]+>", " ", body)
+            text = HTML_TAG_RE.sub(" ", body)
         # normalize whitespace
-        text = re.sub(r"\s+", " ", text).strip()
+        text = WHITESPACE_RE.sub(" ", text).strip()
         # trim to first marker
         lo = text.lower()
         for mk in markers:
-            i = lo.find(mk.lower())
+            i = lo.find(mk)
             if i != -1:
                 text = text[i:]
                 break
         # drop everything before the core Item 1.
-        it = re.search(r"\bITEM\s+1[A-Z]?\.", text, flags=re.IGNORECASE)
+        it = ITEM1_RE.search(text)
         if it:
             text = text[it.start():]
         fragments.append(clean_filing_text(text))
@@ -262,29 +365,62 @@ def extract_filing_text(raw: str, form_type: str) -> str:
 
 
 # ─── Extract Company Facts → plain-English snippets ─────────────────────────────
+def _fact_date(date_str: str) -> date:
+    """XBRL fact dates are ISO "YYYY-MM-DD"; parse them in C, dateutil only as fallback."""
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        return parse_date(date_str).date()
+
+
 def extract_facts_text(cf_json: dict, start: datetime.date, end: datetime.date) -> str:
     snippets = []
     entity = cf_json.get("entityName", "")
     usgaap  = cf_json.get("facts", {}).get("us-gaap", {})
+    append = snippets.append
     for concept, info in usgaap.items():
+        # pretty-print (once per concept, not per fact)
+        lbl = concept.replace("StockholdersEquity", "Shareholders' Equity")
         for unit, items in info.get("units", {}).items():
             for item in items:
                 date_str = item.get("end") or item.get("instant")
                 val      = item.get("val")
                 if val is None or date_str is None:
                     continue
-                dt = parse_date(date_str).date()
+                dt = _fact_date(date_str)
                 if (start and dt < start) or (end and dt > end):
                     continue
-                # pretty-print
-                lbl = concept.replace("StockholdersEquity", "Shareholders' Equity")
-                snippets.append(
-                    f"As of {date_str}, {lbl} for {entity} was {val} {unit}."
-                )
+                append(f"As of {date_str}, {lbl} for {entity} was {val} {unit}.")
     # join into one text blob
     return "\n\n".join(snippets)
 
 
+# ─── Download a single 10-K/10-Q ────────────────────────────────────────────────
+def download_filing(ticker: str, cik: str, form: str, ds: str, acc: str, dest: str) -> bool:
+    """Fetch one full-text submission, extract its text and write it to dest."""
+    acc_nd = acc.replace("-", "")
+    url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_nd}/{acc}.txt"
+    logging.debug("  Downloading %s filed on %s", form, ds)
+    try:
+        r = sec_get(url, USER_AGENT)
+        txt = extract_filing_text(r.text, form_type=form.upper())
+        rec = {
+            "ticker": ticker,
+            "cik": cik.zfill(10),
+            "accession": acc,
+            "filing_date": ds,
+            "form": form.upper(),
+            "url": url,
+            "text": txt
+        }
+        with open(dest, "w", encoding="utf-8") as o:
+            json.dump(rec, o, indent=2, ensure_ascii=False)
+        return True
+    except Exception as e:
+        logging.error("  Failed to download %s: %s", form, e)
+        return False
+
+
 # ─── Main function ──────────────────────────────────────────────────────────────
 def main():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -292,6 +428,9 @@ def main():
     # Parse configuration
     start_date = parse_date(START_DATE).date()
     end_date = date.today()
+    # SEC filingDate values are "YYYY-MM-DD", so ISO strings compare in date
+    # order and the per-filing filter needs no parsing at all
+    start_iso, end_iso = start_date.isoformat(), end_date.isoformat()
     
     logging.info(f"SEC EDGAR Filing Downloader")
     logging.info(f"Mode: {MODE}")
@@ -325,7 +464,7 @@ def main():
         cik = mapping.get(ticker)
         
         if not cik:
-            logging.warning(f"{ticker} not in mapping—skipping")
+            logging.warning("%s not in mapping—skipping", ticker)
             stats["missing_tickers"].append(ticker)
             stats["skipped"] += 1
             continue
@@ -336,69 +475,62 @@ def main():
         try:
             pad = cik.zfill(10)
             # Fetch ALL filings including archived ones
-            forms, dates, accs = fetch_all_company_filings(pad, USER_AGENT)
+            forms, dates, accs = fetch_all_company_filings(pad, USER_AGENT, start_date)
             
             outdir = os.path.join(OUTPUT_DIR, ticker)
             os.makedirs(outdir, exist_ok=True)
+            # One directory listing instead of a stat() per candidate filing
+            existing = set(os.listdir(outdir))
             
             # Count filings in date range
             filings_in_range = 0
+            pending = []
+            queued = set()
             
             # ─── Process 10-K and 10-Q filings ─────────────────────────
             for form, ds, acc in zip(forms, dates, accs):
-                if not is_matching_form(form, ["10-K", "10-Q"]):
+                if not is_matching_form(form, PERIODIC_FORMS):
                     continue
                 
-                fd = datetime.strptime(ds, "%Y-%m-%d").date()
-                if fd < start_date or fd > end_date:
+                if not (start_iso <= ds <= end_iso):
                     continue
                 
+                # Submission pages can repeat an accession; fetch it once
+                if acc in queued:
+                    continue
+                queued.add(acc)
                 filings_in_range += 1
                 
-                acc_nd = acc.replace("-", "")
-                url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_nd}/{acc}.txt"
-                dest = os.path.join(outdir, f"{acc}.json")
-                
-                if os.path.exists(dest):
+                if f"{acc}.json" in existing:
                     logging.debug(f"  {form} {ds}: Already exists—skipping")
                     continue
                 
-                logging.info(f"  Downloading {form} filed on {ds}")
-                try:
-                    r = requests.get(url, headers={"User-Agent": USER_AGENT})
-                    r.raise_for_status()
-                    txt = extract_filing_text(r.text, form_type=form.upper())
-                    rec = {
-                        "ticker": ticker,
-                        "cik": pad,
-                        "accession": acc,
-                        "filing_date": ds,
-                        "form": form.upper(),
-                        "url": url,
-                        "text": txt
-                    }
-                    with open(dest, "w", encoding="utf-8") as o:
-                        json.dump(rec, o, indent=2, ensure_ascii=False)
-                    stats["downloads"] += 1
-                    time.sleep(0.1)  # Rate limiting
-                except Exception as e:
-                    logging.error(f"  Failed to download {form}: {e}")
-                    stats["errors"] += 1
+                pending.append((form, ds, acc, os.path.join(outdir, f"{acc}.json")))
+            
+            logging.info("  Found %d 10-K/10-Q filings in date range (%d new)",
+                         filings_in_range, len(pending))
             
-            logging.info(f"  Found {filings_in_range} 10-K/10-Q filings in date range")
+            # Downloads are network-bound: overlap them on a small pool while
+            # SEC_LIMITER keeps the aggregate request rate within SEC's limit
+            if pending:
+                with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+                    results = list(pool.map(
+                        lambda p: download_filing(ticker, cik, *p), pending
+                    ))
+                stats["downloads"] += sum(results)
+                stats["errors"] += len(results) - sum(results)
             
             # ─── Process Company Facts ──────────────────────────────────
             accession = f"{ticker}_CF"
             cf_dest = os.path.join(outdir, f"{accession}.json")
             
-            if os.path.exists(cf_dest):
+            if f"{accession}.json" in existing:
                 logging.debug(f"  Company Facts: Already exists—skipping")
             else:
                 cf_url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{pad}.json"
                 logging.info(f"  Downloading Company Facts")
                 try:
-                    r = requests.get(cf_url, headers={"User-Agent": USER_AGENT})
-                    r.raise_for_status()
+                    r = sec_get(cf_url, USER_AGENT)
                     cf_json = r.json()
                     text = extract_facts_text(cf_json, start_date, end_date)
                     rec = {
@@ -413,13 +545,12 @@ def main():
                     with open(cf_dest, "w", encoding="utf-8") as o:
                         json.dump(rec, o, indent=2, ensure_ascii=False)
                     stats["downloads"] += 1
-                    time.sleep(0.1)  # Rate limiting
                 except Exception as e:
-                    logging.error(f"  Failed to download Company Facts: {e}")
+                    logging.error("  Failed to download Company Facts: %s", e)
                     stats["errors"] += 1
                     
         except Exception as e:
-            logging.error(f"Failed to process {ticker}: {e}")
+            logging.error("Failed to process %s: %s", ticker, e)
             stats["errors"] += 1
     
     # ─── Final Summary ──────────────────────────────────────────────────────────
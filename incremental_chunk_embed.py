@@ -9,6 +9,8 @@ Incremental SEC EDGAR Chunk, FAISS Embedder & Retriever
 import os
 import json
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import openai
 import tiktoken
@@ -29,14 +31,21 @@ DATA_DIR       = "data"
 INDEX_FILE     = "faiss_index.idx"
 METADATA_FILE  = "faiss_metadata.json"
 BATCH_SIZE     = 100
+EMBED_WORKERS  = 4
+MAX_IN_FLIGHT  = 2 * EMBED_WORKERS
 K_RETRIEVE     = 5
+# "flat" = exact search over every vector; "fp16" = exact search over
+# half-precision vectors (half the memory/bandwidth); "hnsw" = approximate
+# graph index that scales sub-linearly. Only applies to a fresh index.
+INDEX_TYPE     = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+HNSW_M         = 32
 
 # Tokenizer
 tokenizer = tiktoken.get_encoding("cl100k_base")
 
 
 def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
-    tokens = tokenizer.encode(text)
+    tokens = tokenizer.encode_ordinary(text)
     chunks = []
     start = 0
     while start < len(tokens):
@@ -54,6 +63,13 @@ def embed_texts(texts: list[str], model: str = EMBED_MODEL) -> list[list[float]]
 
 
 def build_empty_faiss(dims: int) -> faiss.IndexIDMap:
+    if INDEX_TYPE == "hnsw":
+        # Inner product on L2-normalised vectors == cosine, same as the flat index
+        return faiss.IndexIDMap(faiss.IndexHNSWFlat(dims, HNSW_M, faiss.METRIC_INNER_PRODUCT))
+    if INDEX_TYPE == "fp16":
+        # fp16 scalar quantizer needs no training pass
+        return faiss.IndexIDMap(faiss.IndexScalarQuantizer(
+            dims, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT))
     return faiss.IndexIDMap(faiss.IndexFlatIP(dims))
 
 
@@ -79,69 +95,100 @@ def save_index_metadata(index, metadata):
     faiss.write_index(index, INDEX_FILE)
     logging.info(f"FAISS index saved to {INDEX_FILE}.")
     with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+        # Compact separators: this file grows with every chunk and is re-read
+        # by the retriever, so skip the pretty-printing whitespace
+        json.dump(metadata, f, ensure_ascii=False, separators=(',', ':'))
     logging.info(f"Metadata saved to {METADATA_FILE}.")
 
 
+def iter_new_chunks(existing_keys: set, next_id: int):
+    """Walk data/ and yield (chunk_text, metadata_entry) for chunks not yet indexed."""
+    # Filings are immutable and indexed whole, so one set lookup on the
+    # file name skips reading + re-tokenising everything already embedded
+    indexed_filings = {(t, acc) for t, acc, _ in existing_keys}
+    # scandir's is_dir() uses the dirent type, no extra stat() per entry;
+    # the with-block closes the handle even if the generator is abandoned
+    with os.scandir(DATA_DIR) as entries:
+        for tentry in entries:
+            if not tentry.is_dir():
+                continue
+            ticker, tdir = tentry.name, tentry.path
+            for fname in os.listdir(tdir):
+                if not fname.endswith('.json') or (ticker, fname[:-5]) in indexed_filings:
+                    continue
+                path = os.path.join(tdir, fname)
+                with open(path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                accession = record.get('accession')
+                filing_date = record.get('filing_date', '')
+                full_text = record.get('text', '')
+
+                # Split into chunks
+                chunks = chunk_text(full_text)
+                for idx, chunk in enumerate(chunks):
+                    key = (ticker, accession, idx)
+                    if key in existing_keys:
+                        continue
+                    yield chunk, {
+                        'id': next_id,
+                        'ticker': ticker,
+                        'accession': accession,
+                        'chunk_index': idx,
+                        'filing_date': filing_date,
+                        # include form if needed
+                        'form': record.get('form')
+                    }
+                    next_id += 1
+
+
 def update_embeddings():
     """Main driver: find new chunks, embed, and append to FAISS."""
     index, metadata, existing_keys, next_id = initialize_index()
 
-    new_chunks = []
     new_entries = []
-
-    # Walk through all filings in data/
-    for ticker in os.listdir(DATA_DIR):
-        tdir = os.path.join(DATA_DIR, ticker)
-        if not os.path.isdir(tdir):
-            continue
-        for fname in os.listdir(tdir):
-            if not fname.endswith('.json'):
+    in_flight = deque()
+    batch, batch_ids = [], []
+
+    def add_batch(embeddings, ids):
+        # Each finished batch goes straight into the index as float32, so
+        # the run never holds every embedding as Python float lists
+        nonlocal index
+        arr = np.array(embeddings, dtype='float32')
+        faiss.normalize_L2(arr)
+        if index is None:
+            index = build_empty_faiss(arr.shape[1])
+        index.add_with_ids(arr, np.array(ids, dtype='int64'))
+
+    def drain_oldest():
+        future, ids = in_flight.popleft()
+        add_batch(future.result(), ids)
+
+    # Chunks are streamed straight into embedding batches while the walk
+    # continues. Embedding calls are network-bound, so up to MAX_IN_FLIGHT
+    # batches run on the pool; draining oldest-first keeps vectors added
+    # in id order and bounds how much chunk text is held.
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        for chunk, entry in iter_new_chunks(existing_keys, next_id):
+            batch.append(chunk)
+            batch_ids.append(entry['id'])
+            new_entries.append(entry)
+            if len(batch) < BATCH_SIZE:
                 continue
-            path = os.path.join(tdir, fname)
-            with open(path, 'r', encoding='utf-8') as f:
-                record = json.load(f)
-            accession = record.get('accession')
-            filing_date = record.get('filing_date', '')
-            full_text = record.get('text', '')
-
-            # Split into chunks
-            chunks = chunk_text(full_text)
-            for idx, chunk in enumerate(chunks):
-                key = (ticker, accession, idx)
-                if key in existing_keys:
-                    continue
-                new_chunks.append(chunk)
-                new_entries.append({
-                    'id': next_id,
-                    'ticker': ticker,
-                    'accession': accession,
-                    'chunk_index': idx,
-                    'filing_date': filing_date,
-                    # include form if needed
-                    'form': record.get('form')
-                })
-                next_id += 1
-
-    if not new_chunks:
+            logging.info(f"  Batch {len(new_entries) // BATCH_SIZE}: {len(batch)} chunks")
+            in_flight.append((pool.submit(embed_texts, batch), batch_ids))
+            batch, batch_ids = [], []
+            while len(in_flight) > MAX_IN_FLIGHT:
+                drain_oldest()
+        if batch:
+            logging.info(f"  Batch {len(new_entries) // BATCH_SIZE + 1}: {len(batch)} chunks")
+            in_flight.append((pool.submit(embed_texts, batch), batch_ids))
+        while in_flight:
+            drain_oldest()
+
+    if not new_entries:
         logging.info("No new chunks to embed. Exiting.")
         return
-
-    logging.info(f"Embedding {len(new_chunks)} new chunks...")
-    new_embeddings = []
-    for i in range(0, len(new_chunks), BATCH_SIZE):
-        batch = new_chunks[i:i+BATCH_SIZE]
-        logging.info(f"  Batch {i//BATCH_SIZE + 1}: {len(batch)} chunks")
-        new_embeddings.extend(embed_texts(batch))
-
-    # Build or extend index
-    dims = len(new_embeddings[0])
-    if index is None:
-        index = build_empty_faiss(dims)
-    arr = np.array(new_embeddings, dtype='float32')
-    faiss.normalize_L2(arr)
-    ids = np.array([e['id'] for e in new_entries], dtype='int64')
-    index.add_with_ids(arr, ids)
+    logging.info(f"Embedded {len(new_entries)} new chunks.")
     logging.info(f"Appended {len(new_entries)} vectors to index.")
 
     metadata.extend(new_entries)
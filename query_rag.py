@@ -11,6 +11,10 @@ import os
 import json
 import logging
 import argparse
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
 import openai
 import tiktoken
@@ -33,6 +37,9 @@ METADATA_FILE = "faiss_metadata.json"
 DEFAULT_K     = 5
 CHUNK_SIZE    = 1000    # must match your embedder’s config
 CHUNK_OVERLAP = 200     # must match your embedder’s config
+FILING_CACHE_SIZE = 32  # chunked filings kept in memory between queries
+QUERY_CACHE_SIZE  = 256  # distinct query embeddings kept in memory
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # HNSW recall/speed knob
 
 # ─── Tokenizer ─────────────────────────────────────────────────────────────────
 tokenizer = tiktoken.get_encoding("cl100k_base")
@@ -41,7 +48,7 @@ def chunk_text(text: str,
                chunk_size: int = CHUNK_SIZE,
                overlap:   int = CHUNK_OVERLAP) -> list[str]:
     """Split text into overlapping chunks (must match your indexer!)."""
-    tokens = tokenizer.encode(text)
+    tokens = tokenizer.encode_ordinary(text)
     chunks = []
     start = 0
     while start < len(tokens):
@@ -52,23 +59,87 @@ def chunk_text(text: str,
         start += chunk_size - overlap
     return chunks
 
-def retrieve(query: str, k: int = DEFAULT_K) -> list[dict]:
+# ─── Filing cache ──────────────────────────────────────────────────────────────
+@lru_cache(maxsize=FILING_CACHE_SIZE)
+def load_filing_chunks(ticker: str, accession: str) -> tuple[dict, tuple[str, ...]]:
+    """
+    Load a filing and split it into chunks, memoized per (ticker, accession).
+    Filings never change once downloaded, so a hit skips the JSON read and
+    re-tokenising the whole document. Returns (form/url/cik dict, chunks).
+    """
+    path = os.path.join(DATA_DIR, ticker, f"{accession}.json")
+    with open(path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    info = {"form": record.get("form"), "url": record.get("url"), "cik": record.get("cik")}
+    return info, tuple(chunk_text(record.get("text", "")))
+
+# ─── Query embedding cache ─────────────────────────────────────────────────────
+# LRU of (query, model) -> normalised embedding. Kept by hand rather than with
+# lru_cache so the client (and the API key it carries) is not part of the key
+_query_cache: "OrderedDict[tuple[str, str], np.ndarray]" = OrderedDict()
+_query_lock = threading.Lock()
+
+def embed_query(query: str, model: str = EMBED_MODEL,
+                client: Optional[openai.OpenAI] = None) -> np.ndarray:
+    """
+    Embed and L2-normalise a query, memoized per (query, model) so repeated
+    questions skip the embeddings API round-trip. A cache miss is embedded
+    with `client` if given, else the module-level OPENAI_API_KEY. Callers
+    must not mutate the returned array.
+    """
+    key = (query, model)
+    with _query_lock:
+        arr = _query_cache.get(key)
+        if arr is not None:
+            _query_cache.move_to_end(key)
+            return arr
+    qresp = (client or openai).embeddings.create(model=model, input=[query])
+    arr = np.array([qresp.data[0].embedding], dtype="float32")
+    faiss.normalize_L2(arr)
+    with _query_lock:
+        _query_cache[key] = arr
+        if len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return arr
+
+# ─── Index cache ───────────────────────────────────────────────────────────────
+# (index/metadata mtimes, index, metadata); reloaded only when the embed step
+# rewrites the files, so repeated queries skip the disk read + JSON parse
+_index_cache = (None, None, None)
+_index_lock = threading.Lock()
+
+def load_index():
+    """Return (faiss index, metadata list), re-reading them only when changed on disk."""
+    global _index_cache
+    try:
+        mtimes = (os.stat(INDEX_FILE).st_mtime_ns, os.stat(METADATA_FILE).st_mtime_ns)
+    except FileNotFoundError:
+        raise RuntimeError("Index or metadata file not found. Run your embed step first.")
+    with _index_lock:
+        if _index_cache[0] != mtimes:
+            with open(METADATA_FILE, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            index = faiss.read_index(INDEX_FILE)
+            # HNSW indexes (FAISS_INDEX_TYPE=hnsw) take their search breadth
+            # from efSearch; flat indexes have nothing to tune
+            inner = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+            if isinstance(inner, faiss.IndexHNSW):
+                inner.hnsw.efSearch = HNSW_EF_SEARCH
+            _index_cache = (mtimes, index, metadata)
+        return _index_cache[1], _index_cache[2]
+
+def retrieve(query: str, k: int = DEFAULT_K,
+             client: Optional[openai.OpenAI] = None) -> list[dict]:
     """
     Embed the query, search FAISS for top-k, then load chunk texts.
+    `client` embeds the query under the caller's key (default: OPENAI_API_KEY).
     Returns a list of dicts: metadata + 'text' + 'score' + form/url/cik.
     """
-    # 1) Load index & metadata
-    if not os.path.exists(METADATA_FILE) or not os.path.exists(INDEX_FILE):
-        raise RuntimeError("Index or metadata file not found. Run your embed step first.")
-    with open(METADATA_FILE, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
-    index = faiss.read_index(INDEX_FILE)
-
-    # 2) Embed query
-    qresp = openai.embeddings.create(model=EMBED_MODEL, input=[query])
-    q_emb = qresp.data[0].embedding
-    arr = np.array([q_emb], dtype="float32")
-    faiss.normalize_L2(arr)
+    # 1) Load index & metadata (cached between calls)
+    index, metadata = load_index()
+
+    # 2) Embed query (cached per distinct query)
+    arr = embed_query(query, client=client)
 
     # 3) Search
     distances, ids = index.search(arr, k)
@@ -81,20 +152,17 @@ def retrieve(query: str, k: int = DEFAULT_K) -> list[dict]:
         entry = metadata[vid].copy()
         entry["score"] = float(distances[0][rank])
 
-        # Load the original JSON to pull form, url, cik, and chunk text
-        path = os.path.join(DATA_DIR, entry["ticker"], f"{entry['accession']}.json")
+        # Load the original filing to pull form, url, cik, and chunk text
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                record = json.load(f)
+            record, chunks = load_filing_chunks(entry["ticker"], entry["accession"])
 
             # Extract the correct chunk
-            chunks = chunk_text(record.get("text", ""))
             entry["text"] = chunks[entry["chunk_index"]]
 
             # Include the real form, url, and cik
-            entry["form"] = record.get("form")
-            entry["url"]  = record.get("url")
-            entry["cik"]  = record.get("cik")
+            entry["form"] = record["form"]
+            entry["url"]  = record["url"]
+            entry["cik"]  = record["cik"]
 
         except FileNotFoundError:
             logging.warning(